@@ -4,6 +4,7 @@ import pty
 import tty
 import termios
 import select
+import selectors
 import time
 import datetime
 import re
@@ -15,12 +16,54 @@ import argparse
 # Configuration
 LOG_DIR = os.path.expanduser("~/.kali-logs")
 SHELL = os.environ.get("SHELL", "/bin/bash")
+READ_SIZE = 64 * 1024
+MAX_DRAIN_SIZE = 1024 * 1024 # Cap per wakeup so keyboard input (Ctrl+C) is never starved
+LOG_BUFFER_SIZE = 64 * 1024 # Flush the clean log once this much is pending...
+LOG_FLUSH_INTERVAL = 1.0    # ...or after this many seconds
+
+# Tokenizer for the escape sequences we care about (compiled once, used per PTY read).
+# Works on raw bytes: escape sequences are pure ASCII, so only text spans ever get decoded.
+# 1. CSI: \x1b [ ...
+# 2. OSC: \x1b ] ... \x07|\x1b\\
+# 3. Two-char escapes: \x1b [=@>78()EHM] (Covering Keypad, Charset, Headers)
+_TOKEN_RE = re.compile(
+    rb'(\x1b\[[0-9;?]*[\x40-\x7e])|'       # CSI
+    rb'(\x1b][0-9]*;.*?(?:\x07|\x1b\\))|'  # OSC
+    rb'(\x1b[=@>78()EHM])'                 # Special 2-char Escapes (Fixes "==" issue)
+)
+
+# Sequences that leave the alt screen (nano, vim, less)
+_ALT_SCREEN_EXITS = (b'\x1b[?1049l', b'\x1b[?47l')
+
+# Mode switching CSIs: sequence -> (mode, new value, clean-log marker)
+_ENTER_MARKER = "\n[LOG: Entered Interactive Mode]"
+_EXIT_MARKER = "\n[LOG: Exited Interactive Mode]"
+_CSI_MODES = {
+    # Alt Screen Detection (Support both ?1049 and ?47)
+    b'\x1b[?1049h': ('alt', True, _ENTER_MARKER),
+    b'\x1b[?47h': ('alt', True, _ENTER_MARKER),
+    b'\x1b[?1049l': ('alt', False, _EXIT_MARKER),
+    b'\x1b[?47l': ('alt', False, _EXIT_MARKER),
+    # Bracketed Paste
+    b'\x1b[?2004h': ('paste', True, None),
+    b'\x1b[?2004l': ('paste', False, None),
+}
 
 def get_session_filename():
     """Generates a timestamped filename."""
     now = datetime.datetime.now()
     return now.strftime("%Y-%m-%d_%H-%M-%S")
 
+_ts_cache = (0, "")
+
+def log_timestamp():
+    """Returns the clean-log line prefix, re-formatting it only when the second changes."""
+    global _ts_cache
+    sec = int(time.time())
+    if sec != _ts_cache[0]:
+        _ts_cache = (sec, time.strftime("[%Y-%m-%d %H:%M:%S] ", time.localtime(sec)))
+    return _ts_cache[1]
+
 def resize_pty(master_fd):
     """Resizes the PTY to match the current terminal window size."""
     try:
@@ -31,124 +74,207 @@ def resize_pty(master_fd):
     except Exception:
         pass
 
+def write_all(fd, data):
+    """Writes all of data to fd, waiting for room if the fd is non-blocking."""
+    view = memoryview(data)
+    while view:
+        try:
+            n = os.write(fd, view)
+        except BlockingIOError:
+            select.select([], [fd], [])
+            continue
+        view = view[n:]
+
 class VT100Lite:
     """
     A robust terminal emulator to reconstruct the visible screen buffer.
     Handles cursor, clearing, and special Zsh/Kali escape sequences.
     """
+    def __init__(self):
         self.cursor_x = 0
-        self.buffer = [] 
+        # One byte per column; non-ASCII characters sit in unicode_cells over a '?' placeholder
+        self.buffer = bytearray()
+        self.unicode_cells = {}
         self.in_alt_screen = False
         self.bracketed_paste_mode = False
         self.last_logged_line = None
 
+        # CSI handlers by final byte value (mode switches are matched first via _CSI_MODES)
+        self._csi_dispatch = {
+            ord('K'): self._erase_line,
+            ord('G'): self._cursor_col,
+            ord('`'): self._cursor_col,
+        }
+
     def process(self, chunk):
-        # Improved Regex for better tokenization
-        # 1. CSI: \x1b [ ...
-        # 2. OSC: \x1b ] ... \x07|\x1b\\
-        # 3. Two-char escapes: \x1b [=@>78()EHM] (Covering Keypad, Charset, Headers)
-        token_pattern = re.compile(
-            r'(\x1b\[[0-9;?]*[\x40-\x7e])|'       # CSI
-            r'(\x1b][0-9]*;.*?(?:\x07|\x1b\\))|'  # OSC
-            r'(\x1b[=@>78()EHM])'                 # Special 2-char Escapes (Fixes "==" issue)
-        )
-        
+        """Feeds raw PTY bytes through the emulator, returning the completed lines"""
+        # Interactive apps redraw the alt screen constantly and only the raw log keeps it,
+        # so skip parsing entirely until the sequence that leaves it
+        if self.in_alt_screen:
+            exit_pos = self._find_alt_screen_exit(chunk)
+            if exit_pos == -1:
+                return []
+            chunk = chunk[exit_pos:]
+
+        # Fast path: plain output with no escape sequences skips the tokenizer entirely
+        if b'\x1b' not in chunk:
+            completed_lines = []
+            self._handle_text(chunk, completed_lines)
+            return completed_lines
+
+        # Walk the chunk ESC to ESC: plain text between escapes is sliced out with bytes.find,
+        # and the regex only runs anchored at each ESC
         completed_lines = []
-        parts = token_pattern.split(chunk)
-        
-        for part in parts:
-            if not part: continue
-            
-            if part.startswith('\x1b['):
-                self._handle_csi(part, completed_lines)
-            elif part.startswith('\x1b]'):
-                pass # Ignore OSC (Window Titles)
-            elif part.startswith('\x1b'):
-                # Handle special 2-char escapes (DECKPAM, etc) allow us to ignore them silently
-                pass 
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            esc = chunk.find(b'\x1b', pos)
+            if esc == -1:
+                self._handle_text(chunk[pos:], completed_lines)
+                break
+            if esc > pos:
+                self._handle_text(chunk[pos:esc], completed_lines)
+
+            m = _TOKEN_RE.match(chunk, esc)
+            if m:
+                # Only CSI matters; OSC (Window Titles) and special 2-char escapes (DECKPAM, etc) are ignored silently
+                pos = m.end()
+                if m.lastindex == 1:
+                    self._handle_csi(m.group(), completed_lines)
+                    if self.in_alt_screen:
+                        # Entered the alt screen: nothing is parsed until it is left again
+                        pos = self._find_alt_screen_exit(chunk, pos)
+                        if pos == -1:
+                            break
             else:
-                lines = self._handle_text(part)
-                completed_lines.extend(lines)
+                # Unrecognised escape: drop the ESC itself and keep the text after it
+                pos = esc + 1
                 
         return completed_lines
 
+    def _find_alt_screen_exit(self, chunk, start=0):
+        """Index of the first alt screen exit sequence in chunk (from start), or -1"""
+        found = -1
+        for seq in _ALT_SCREEN_EXITS:
+            pos = chunk.find(seq, start)
+            if pos != -1 and (found == -1 or pos < found):
+                found = pos
+        return found
+
     def _handle_csi(self, seq, out_list):
-        # Alt Screen Detection (Support both ?1049 and ?47)
-        if seq in ('\x1b[?1049h', '\x1b[?47h'):
-            self.in_alt_screen = True
-            out_list.append("\n[LOG: Entered Interactive Mode]")
-        elif seq in ('\x1b[?1049l', '\x1b[?47l'):
-            self.in_alt_screen = False
-            out_list.append("\n[LOG: Exited Interactive Mode]")
-        
-        # Bracketed Paste
-        elif seq == '\x1b[?2004h': self.bracketed_paste_mode = True
-        elif seq == '\x1b[?2004l': self.bracketed_paste_mode = False
-            
-        # Handle Erase Line
-        elif seq.endswith('K'):
-            mode = 0
-            if len(seq) > 3:
-                try: mode = int(seq[2:-1])
-                except: pass
-            
-            if mode == 0: self.buffer = self.buffer[:self.cursor_x]
-            elif mode == 2: 
-                self.buffer = []
-                self.cursor_x = 0
-                
-        # Cursor Horizontal 
-        elif seq.endswith('G') or seq.endswith('`'):
-            try:
-                col = int(seq[2:-1])
-                self.cursor_x = max(0, col - 1)
+        mode = _CSI_MODES.get(seq)
+        if mode is not None:
+            kind, value, marker = mode
+            if kind == 'alt':
+                self.in_alt_screen = value
+                if value:
+                    # Log any pending shell text (e.g. a prompt without newline) before the
+                    # alt screen takes over; nothing is parsed in there, so exit needs no reset
+                    line_str = self._line_str()
+                    if line_str:
+                        out_list.append(line_str)
+                    self.buffer.clear()
+                    self.unicode_cells.clear()
+                    self.cursor_x = 0
+            else:
+                self.bracketed_paste_mode = value
+            if marker:
+                out_list.append(marker)
+            return
+        # Everything else is identified by its final byte (an int, since seq is bytes)
+        handler = self._csi_dispatch.get(seq[-1])
+        if handler:
+            handler(seq, out_list)
+
+    def _erase_line(self, seq, out_list):
+        mode = 0
+        if len(seq) > 3:
+            try: mode = int(seq[2:-1])
             except: pass
-            
-        # Cursor Vertical (A=Up, B=Down) OR Absolute Position (H, f) - Important for Nano
-        elif (seq.endswith('A') or seq.endswith('B') or seq.endswith('H') or seq.endswith('f')) and self.in_alt_screen:
-            # Whenever the cursor jumps around in an editor, we assume the previous line is "done" enough to log
-            line_str = "".join(self.buffer).rstrip()
-            if line_str:
-                out_list.append(line_str)
-            self.buffer = []
+        
+        if mode == 0:
+            # Truncate in place rather than rebuilding the buffer from a slice
+            del self.buffer[self.cursor_x:]
+            if self.unicode_cells:
+                self._drop_cells(self.cursor_x)
+        elif mode == 2: 
+            self.buffer.clear()
+            self.unicode_cells.clear()
             self.cursor_x = 0
 
-    def _handle_text(self, text):
-        lines_out = []
-        for char in text:
-            # In Interactive Mode (Nano), CR (\r) usually acts as a Line Break.
+    # Cursor Horizontal 
+    def _cursor_col(self, seq, out_list):
+        try:
+            col = int(seq[2:-1])
+            self.cursor_x = max(0, col - 1)
+        except: pass
+
+    def _handle_text(self, text, out_list):
+        # Split on control characters and write whole runs of text at once,
+        # instead of walking the chunk one character at a time.
+        if b'\x07' in text: # Bell
+            text = text.replace(b'\x07', b'')
+
+        for i, segment in enumerate(text.split(b'\n')):
+            if i:
+                line_str = self._line_str()
+                if line_str:
+                    out_list.append(line_str)
+                self.buffer.clear()
+                self.unicode_cells.clear()
+                self.cursor_x = 0
+
             # In Shell, CR (\r) moves cursor to start (no newline).
-            if char == '\r':
-                if self.in_alt_screen:
-                    # Flush as a newline
-                    line_str = "".join(self.buffer).rstrip()
-                    if line_str:
-                        lines_out.append(line_str)
-                    self.buffer = []
+            for j, piece in enumerate(segment.split(b'\r')):
+                if j:
                     self.cursor_x = 0
+                for k, run in enumerate(piece.split(b'\x08')):
+                    if k: # Backspace
+                        self.cursor_x = max(0, self.cursor_x - 1)
+                    if run:
+                        self._write_run(run)
+
+    def _write_run(self, run):
+        """Overwrite the buffer at the cursor with a run of printable bytes"""
+        start = self.cursor_x
+        pad = start - len(self.buffer)
+        if pad > 0:
+            self.buffer += b' ' * pad
+        if run.isascii():
+            # ASCII bytes go straight into the buffer, no decoding needed
+            end = start + len(run)
+            self.buffer[start:end] = run
+            if self.unicode_cells:
+                self._drop_cells(start, end)
+        else:
+            text = run.decode('utf-8', 'replace')
+            end = start + len(text)
+            self.buffer[start:end] = text.encode('ascii', 'replace')
+            for col, char in enumerate(text, start):
+                if char.isascii():
+                    self.unicode_cells.pop(col, None)
                 else:
-                    self.cursor_x = 0
-            elif char == '\n':
-                line_str = "".join(self.buffer).rstrip()
-                if line_str:
-                    lines_out.append(line_str)
-                self.buffer = []
-                self.cursor_x = 0
-            elif char == '\x08': # Backspace
-                self.cursor_x = max(0, self.cursor_x - 1)
-            elif char == '\x07': # Bell
-                pass
-            else:
-                if len(self.buffer) <= self.cursor_x:
-                     self.buffer.extend([' '] * (self.cursor_x - len(self.buffer) + 1))
-                self.buffer[self.cursor_x] = char
-                self.cursor_x += 1
-        return lines_out
+                    self.unicode_cells[col] = char
+        self.cursor_x = end
+
+    def _line_str(self):
+        """Decode the line buffer, merging back any non-ASCII cells"""
+        if not self.unicode_cells:
+            return self.buffer.decode('ascii', 'replace').rstrip()
+        cells = list(self.buffer.decode('ascii', 'replace'))
+        for col, char in self.unicode_cells.items():
+            cells[col] = char
+        return "".join(cells).rstrip()
+
+    def _drop_cells(self, start, end=None):
+        """Forget non-ASCII cells from start (to end) after they were overwritten or erased"""
+        for col in [c for c in self.unicode_cells if c >= start and (end is None or c < end)]:
+            del self.unicode_cells[col]
 
     def flush(self):
         """Force flush current buffer (e.g. on exit)"""
         if self.buffer:
-           return ["".join(self.buffer).rstrip()]
+           return [self._line_str()]
         return []
 
 def main():
@@ -169,8 +295,9 @@ def main():
     print(f"[*] Type 'exit' or Ctrl+D to stop.")
 
     try:
-        raw_file = open(raw_log_path, 'wb')
-        clean_file = open(clean_log_path, 'w', encoding='utf-8', errors='replace')
+        # Raw log is written straight to the fd: it gets exactly what the PTY produced
+        raw_fd = os.open(raw_log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        clean_file = open(clean_log_path, 'w', encoding='utf-8', errors='replace', buffering=LOG_BUFFER_SIZE)
     except Exception as e:
         print(f"Error opening log files: {e}")
         return
@@ -201,93 +328,152 @@ def main():
         signal.signal(signal.SIGWINCH, curried_resize)
         resize_pty(master_fd)
 
+        # Closing the terminal window sends SIGHUP: exit through the finally block
+        # so the buffered clean log is flushed and closed instead of lost
+        def hangup(signum, frame):
+            sys.exit(0)
+        signal.signal(signal.SIGHUP, hangup)
+        signal.signal(signal.SIGTERM, hangup)
+
+        # Non-blocking so each wakeup can drain everything the PTY has buffered
+        flags = fcntl.fcntl(master_fd, fcntl.F_GETFL)
+        fcntl.fcntl(master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        stdin_fd = sys.stdin.fileno()
+        stdout_fd = sys.stdout.fileno()
+        sel = selectors.DefaultSelector() # epoll on Linux
+        sel.register(stdin_fd, selectors.EVENT_READ)
+        sel.register(master_fd, selectors.EVENT_READ)
+
         try:
-            tty.setraw(sys.stdin.fileno())
+            tty.setraw(stdin_fd)
             
-            clean_log_buffer = "" # For grouping ANSI tokens
+            clean_log_buffer = bytearray() # For grouping ANSI tokens (raw bytes, decoded on use)
+            bytes_since_flush = 0
+            last_flush_ts = time.monotonic()
             
             while True:
-                r, w, x = select.select([sys.stdin, master_fd], [], [])
+                # Timeout lets pending log output get flushed while the session is idle
+                ready = {key.fd for key, _ in sel.select(LOG_FLUSH_INTERVAL)}
                 
-                if sys.stdin in r:
+                if stdin_fd in ready:
                     try:
-                        d = os.read(sys.stdin.fileno(), 1024)
+                        d = os.read(stdin_fd, 1024)
                     except OSError:
                         d = b""
                     if not d:
                         break
-                    os.write(master_fd, d)
+                    write_all(master_fd, d)
 
-                if master_fd in r:
-                    try:
-                        o = os.read(master_fd, 10240)
-                    except OSError:
-                        o = b""
+                if master_fd in ready:
+                    # Drain the PTY so a burst of output is echoed, logged and parsed in one pass
+                    parts = []
+                    pending = 0
+                    eof = False
+                    while pending < MAX_DRAIN_SIZE:
+                        try:
+                            chunk = os.read(master_fd, READ_SIZE)
+                        except BlockingIOError:
+                            break
+                        except OSError:
+                            chunk = b""
+                        if not chunk:
+                            eof = True
+                            break
+                        parts.append(chunk)
+                        pending += len(chunk)
+
+                    o = b"".join(parts)
                     if not o:
-                        break
+                        if eof:
+                            break
+                        continue
                     
+                    # Same buffer goes to the screen and the raw log, no intermediate copies
                     try:
-                        os.write(sys.stdout.fileno(), o)
+                        write_all(stdout_fd, o)
                     except OSError:
                          pass
 
-                    raw_file.write(o)
-                    raw_file.flush()
+                    write_all(raw_fd, o)
 
                     # VT100 Logging Logic
-                    # 1. Accumulate text to safe-parse ANSI
-                    text = o.decode('utf-8', errors='replace')
-                    clean_log_buffer += text
+                    # 1. Accumulate bytes to safe-parse ANSI
+                    clean_log_buffer += o
                     
                     # 2. Heuristic: Wait for complete ANSI sequences
                     # If end matches incomplete escape, wait.
                     # Simple check: If \x1B is present near end.
-                    to_process = ""
-                    last_esc = clean_log_buffer.rfind('\x1B')
+                    # The emulator takes bytes, so nothing is decoded here.
+                    to_process = b""
+                    last_esc = clean_log_buffer.rfind(b'\x1b')
                     if last_esc == -1:
-                        to_process = clean_log_buffer
-                        clean_log_buffer = ""
+                        to_process = bytes(clean_log_buffer)
+                        clean_log_buffer.clear()
                     elif (len(clean_log_buffer) - last_esc) > 256: 
                         # Timeout logic (too long, assume text)
-                        to_process = clean_log_buffer
-                        clean_log_buffer = ""
+                        to_process = bytes(clean_log_buffer)
+                        clean_log_buffer.clear()
                     else:
                         # Keep potential sequence
-                        to_process = clean_log_buffer[:last_esc]
-                        clean_log_buffer = clean_log_buffer[last_esc:]
+                        to_process = bytes(clean_log_buffer[:last_esc])
+                        del clean_log_buffer[:last_esc]
                     
                     if to_process:
                         # 3. Feed to VT100 Emulator
                         lines = vt.process(to_process)
                         
-                        # 4. Write completed lines with Timestamp
+                        # 4. Write completed lines with Timestamp (one write per wakeup)
+                        timestamp = log_timestamp()
+                        out_chunks = []
                         for line in lines:
                              # Deduplication Logic: Ignore if identical to last line (fixes prompt double-echo)
                              if line == vt.last_logged_line:
                                  continue
                                  
                              vt.last_logged_line = line
-                             timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-                             clean_file.write(f"{timestamp}{line}\n")
-                             clean_file.flush()
+                             out_chunks.append(f"{timestamp}{line}\n")
+
+                        if out_chunks:
+                            entries = "".join(out_chunks)
+                            clean_file.write(entries)
+                            bytes_since_flush += len(entries)
+
+                    if eof:
+                        break
+
+                # 5. Flush the clean log on a size/time threshold rather than per line
+                now = time.monotonic()
+                if bytes_since_flush and (bytes_since_flush > LOG_BUFFER_SIZE or now - last_flush_ts > LOG_FLUSH_INTERVAL):
+                    clean_file.flush()
+                    bytes_since_flush = 0
+                    last_flush_ts = now
 
         except OSError as e:
             pass
             
         finally:
             if old_tty:
-                termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_tty)
+                try:
+                    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_tty)
+                except (termios.error, OSError):
+                    pass # Terminal already gone (hangup)
             
-            # Flush trailing
-            trailing_lines = vt.flush() # + maybe clean_log_buffer content if any text left?
+            # Flush trailing: process any held-back remainder, then the final buffer once
             if clean_log_buffer:
-                trailing_lines += vt.process(clean_log_buffer) # Process remainder
+                trailing_lines = vt.process(bytes(clean_log_buffer))
+            else:
+                trailing_lines = []
+            trailing_lines += vt.flush()
             
-            for line in trailing_lines + vt.flush(): # Flush final buffer
-                 timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
+            timestamp = log_timestamp()
+            for line in trailing_lines:
                  clean_file.write(f"{timestamp}{line}\n")
             
-            raw_file.close()
+            sel.close()
+
+            # close() flushes whatever is still buffered
+            os.close(raw_fd)
             clean_file.close()
             
             print(f"\n[*] Session capture ended.")